@@ -19,8 +19,11 @@ import osmnx as ox
 import networkx as nx
 import pandas as pd
 import numpy as np
-from difflib import get_close_matches
+from rapidfuzz import process, fuzz
+from scipy.spatial import cKDTree
+import hashlib
 import os
+import pickle
 from typing import Tuple
 import matplotlib.pyplot as plt
 
@@ -45,6 +48,25 @@ MAX_SPEEDS={'living_street': '20',
  'motorway_link': '70',
  'motorway': '100'}
 
+# Versión con los valores ya convertidos a float, para no repetir la conversión por arista
+MAX_SPEEDS_F = {k: float(v) for k, v in MAX_SPEEDS.items()}
+
+# Abreviaturas habituales del tipo de vía, para poder acotar la búsqueda fuzzy
+# aunque el usuario no escriba el tipo completo
+ALIAS_VIA_CLASE = {"c": "CALLE",
+ "cl": "CALLE",
+ "cll": "CALLE",
+ "av": "AVENIDA",
+ "avd": "AVENIDA",
+ "avda": "AVENIDA",
+ "pza": "PLAZA",
+ "plza": "PLAZA",
+ "po": "PASEO",
+ "ps": "PASEO",
+ "gta": "GLORIETA",
+ "cno": "CAMINO",
+ "ctra": "CARRETERA"}
+
 
 class ServiceNotAvailableError(Exception):
     "Excepción que indica que la navegación no está disponible en este momento"
@@ -76,6 +98,24 @@ def coord_to_decimal(cadena:str)-> float:
     return num
 
 
+def coords_a_decimal(serie: pd.Series) -> pd.Series:
+    """Función que convierte una Serie de coordenadas en formato grados, minutos y segundos a grados decimales.
+    Versión vectorizada de coord_to_decimal: en vez de llamar a una función de Python por fila,
+    extrae las partes con una única expresión regular y opera sobre las columnas numéricas resultantes.
+
+    Args:
+        serie (pd.Series): Serie de coordenadas en formato DMS seguidas de la orientación (N, S, E o W)
+
+    Returns:
+        pd.Series: Serie con los valores de las coordenadas expresados en grados decimales
+    """
+    partes = serie.str.extract(r"(\d+)°\s*(\d+)'\s*([\d.]+)'*\s*([NSEW])")
+    num = partes[0].astype(float) + partes[1].astype(float)/60 + partes[2].astype(float)/3600
+    # Las orientaciones S y W llevan signo negativo
+    num = num.where(~partes[3].isin(["S","W"]), -num)
+    return num
+
+
 def construir_direccion(fila: pd.Series) -> str:
     """Función que construye una dirección a partir de los campos del callejero
 
@@ -101,6 +141,22 @@ def construir_direccion(fila: pd.Series) -> str:
     return f"{nombre_via}, {numero}"
 
 
+def _construir_indice_direcciones(df: pd.DataFrame) -> dict:
+    """Función que construye un diccionario direccion -> (latitud, longitud) para búsqueda exacta en O(1)
+
+    Args:
+        df (pd.DataFrame): DataFrame del callejero con las columnas "DIRECCION_TEXTO", "LATITUD" y "LONGITUD"
+
+    Returns:
+        dict: Diccionario que asocia cada dirección con su par (latitud, longitud)
+    """
+    indice = {}
+    for texto, lat, lon in zip(df["DIRECCION_TEXTO"], df["LATITUD"], df["LONGITUD"]):
+        # setdefault conserva la primera fila si hay direcciones duplicadas
+        indice.setdefault(texto, (float(lat), float(lon)))
+    return indice
+
+
 def carga_callejero() -> pd.DataFrame:
     """ Función que carga el callejero de Madrid, lo procesa y devuelve
     un DataFrame con los datos procesados
@@ -113,17 +169,35 @@ def carga_callejero() -> pd.DataFrame:
     """
     # Columnas que pide el enunciado
     COLUMNAS = ["VIA_CLASE", "VIA_PAR", "VIA_NOMBRE", "NUMERO", "LATITUD", "LONGITUD"]
+    # Tipos explícitos: nos ahorramos la pasada de inferencia de tipos del lector
+    TIPOS = {columna: "string" for columna in COLUMNAS}
     try:
-        direcciones_df = pd.read_csv("direcciones.csv", sep=";", encoding="latin-1", usecols=COLUMNAS)
+        try:
+            # El motor pyarrow lee en paralelo y es bastante más rápido si está instalado
+            direcciones_df = pd.read_csv("direcciones.csv", sep=";", encoding="latin-1", usecols=COLUMNAS, dtype=TIPOS, engine="pyarrow")
+        except ImportError:
+            direcciones_df = pd.read_csv("direcciones.csv", sep=";", encoding="latin-1", usecols=COLUMNAS, dtype=TIPOS, engine="c")
     except FileNotFoundError:
         raise FileNotFoundError("El fichero csv con las direcciones no existe")
-    # Convertimos de coordenadas a grados decimales
-    direcciones_df["LATITUD"] = direcciones_df["LATITUD"].map(coord_to_decimal)
-    direcciones_df["LONGITUD"] = direcciones_df["LONGITUD"].map(coord_to_decimal)
+    # Convertimos de coordenadas a grados decimales (vectorizado sobre toda la columna)
+    direcciones_df["LATITUD"] = coords_a_decimal(direcciones_df["LATITUD"])
+    direcciones_df["LONGITUD"] = coords_a_decimal(direcciones_df["LONGITUD"])
     direcciones_df["VIA_CLASE"] = direcciones_df["VIA_CLASE"].str.upper()
     direcciones_df["VIA_PAR"]   = direcciones_df["VIA_PAR"].str.upper()
     direcciones_df["VIA_NOMBRE"] = direcciones_df["VIA_NOMBRE"].str.upper()
-    direcciones_df["DIRECCION_TEXTO"] = direcciones_df.apply(construir_direccion,axis=1)
+    # Convertimos NUMERO a texto una sola vez para toda la columna
+    direcciones_df["NUMERO"] = direcciones_df["NUMERO"].astype(str).str.strip()
+    # Construimos DIRECCION_TEXTO con operaciones de cadena vectorizadas en vez de apply fila a fila
+    clase = direcciones_df["VIA_CLASE"].str.title()
+    nombre = direcciones_df["VIA_NOMBRE"].str.title()
+    numero = direcciones_df["NUMERO"]
+    # VIA_PAR puede ser NaN: máscara a nivel de bits para decidir el formato de cada fila
+    via_par = direcciones_df["VIA_PAR"]
+    tiene_par = via_par.notna() & (via_par.str.strip() != "")
+    par = via_par.fillna("").str.strip().str.lower()
+    direcciones_df["DIRECCION_TEXTO"] = np.where(tiene_par, clase + " " + par + " " + nombre, clase + " " + nombre) + ", " + numero
+    # Índice de búsqueda exacta para no recorrer todo el dataframe en cada consulta
+    direcciones_df.attrs["indice"] = _construir_indice_direcciones(direcciones_df)
     return direcciones_df
 
 
@@ -145,16 +219,47 @@ def busca_direccion(direccion:str, callejero:pd.DataFrame) -> Tuple[float,float]
         busca_direccion("Calle de Alberto Aguilera, 25", data)=(40.43013055555555,-3.7126916666666667)
     """
     direccion_busqueda = direccion.strip()
-    # Buscamos coincidencia en la columna DIRECCION_TEXTO
-    coincidencia = callejero["DIRECCION_TEXTO"] == direccion_busqueda
+    # Buscamos en el índice hash (lo construimos si el dataframe no lo trae)
+    indice = callejero.attrs.get("indice")
+    if indice is None:
+        indice = _construir_indice_direcciones(callejero)
+        callejero.attrs["indice"] = indice
+    coordenadas = indice.get(direccion_busqueda)
     # Si no hay lanzamos error
-    if not coincidencia.any():
+    if coordenadas is None:
         raise AdressNotFoundError(f"La dirección {direccion} no existe en el callejero")
-    # Si hay varias filas que coinciden, elegimos la primera
-    fila = callejero[coincidencia].iloc[0]
-    latitud = float(fila["LATITUD"])
-    longitud = float(fila["LONGITUD"])
-    return latitud, longitud
+    return coordenadas
+
+
+def _candidatos_por_clase(direccion: str, callejero: pd.DataFrame):
+    """Acota las direcciones candidatas para la búsqueda fuzzy según el tipo de vía
+    con el que empieza la consulta (Calle, Avenida...), tolerando abreviaturas.
+    Así la comparación de cadenas se hace sobre un grupo pequeño en vez de sobre
+    todo el callejero.
+
+    Args:
+        direccion (str): Dirección consultada, ya sin espacios sobrantes
+        callejero (DataFrame): DataFrame con la información de las calles
+
+    Returns:
+        Par (direcciones, etiquetas) con las direcciones del grupo y sus etiquetas de fila,
+        o (None, None) si no se puede determinar el tipo de vía
+    """
+    if "VIA_CLASE" not in callejero.columns or not direccion:
+        return None, None
+    # Agrupamos las direcciones por tipo de vía una única vez
+    por_clase = callejero.attrs.get("por_clase")
+    if por_clase is None:
+        por_clase = {}
+        for clase, grupo in callejero.groupby("VIA_CLASE"):
+            por_clase[clase] = (grupo["DIRECCION_TEXTO"].values, grupo.index.values)
+        callejero.attrs["por_clase"] = por_clase
+    # Primer token de la consulta: puede ser el tipo completo o una abreviatura
+    token = direccion.split()[0].rstrip(".").upper()
+    clase = token if token in por_clase else ALIAS_VIA_CLASE.get(token.lower())
+    if clase is None or clase not in por_clase:
+        return None, None
+    return por_clase[clase]
 
 
 def busca_direccion_fuzzy(direccion:str, callejero:pd.DataFrame, umbral_similitud:float=0.8) -> Tuple[float,float]:
@@ -176,16 +281,34 @@ def busca_direccion_fuzzy(direccion:str, callejero:pd.DataFrame, umbral_similitu
         busca_direccion_fuzzy("Calle de Alberto Aguilera, 23", data)=(40.42998055555555,-3.7112583333333333)
     """
     direccion_busqueda = direccion.strip()
-    # Lista de direcciones del dataframe
-    direcciones_lista = callejero["DIRECCION_TEXTO"].tolist()
-    # Buscamos la dirección más parecida (n=1)
-    coincidencias = get_close_matches(direccion_busqueda, direcciones_lista, n=1, cutoff=umbral_similitud)
-    if not coincidencias:
+    # Primero intentamos buscar solo dentro del grupo del tipo de vía de la consulta
+    candidatas, etiquetas = _candidatos_por_clase(direccion_busqueda, callejero)
+    if candidatas is not None:
+        coincidencia = process.extractOne(direccion_busqueda, candidatas, scorer=fuzz.WRatio, score_cutoff=umbral_similitud*100)
+        if coincidencia is not None:
+            # Si el dataframe trae el índice de búsqueda exacta lo aprovechamos:
+            # nos ahorramos materializar la fila y las conversiones a float
+            indice = callejero.attrs.get("indice")
+            if indice is not None:
+                return indice[coincidencia[0]]
+            fila = callejero.loc[etiquetas[coincidencia[2]]]
+            return float(fila["LATITUD"]), float(fila["LONGITUD"])
+    # Si no, buscamos sobre todo el callejero
+    # Array de direcciones del dataframe (lo guardamos en attrs para no reconstruirlo en cada llamada)
+    direcciones = callejero.attrs.get("direcciones_array")
+    if direcciones is None:
+        direcciones = callejero["DIRECCION_TEXTO"].values
+        callejero.attrs["direcciones_array"] = direcciones
+    # Buscamos la dirección más parecida (rapidfuzz devuelve (cadena, puntuación, índice))
+    coincidencia = process.extractOne(direccion_busqueda, direcciones, scorer=fuzz.WRatio, score_cutoff=umbral_similitud*100)
+    if coincidencia is None:
         raise AdressNotFoundError(f"No se ha encontrado ninguna dirección parecida a {direccion}")
-    mejor_coincidencia = coincidencias[0]
-    # Ahora buscamos esa cadena exacta en el dataframe y sacamos la primera fila
-    coincidencia = callejero["DIRECCION_TEXTO"] == mejor_coincidencia
-    fila = callejero[coincidencia].iloc[0]
+    # Con el índice de búsqueda exacta evitamos materializar la fila
+    indice = callejero.attrs.get("indice")
+    if indice is not None:
+        return indice[coincidencia[0]]
+    # El índice de la coincidencia nos da la fila directamente, sin segunda búsqueda
+    fila = callejero.iloc[coincidencia[2]]
     latitud = float(fila["LATITUD"])
     longitud = float(fila["LONGITUD"])
     return latitud, longitud
@@ -194,6 +317,11 @@ def busca_direccion_fuzzy(direccion:str, callejero:pd.DataFrame, umbral_similitu
 ############## Parte 4 ##############
 
 
+def _mascara_listas(serie: pd.Series) -> pd.Series:
+    """Devuelve la máscara booleana de las posiciones de la serie que contienen listas."""
+    return serie.map(type).eq(list)
+
+
 def carga_grafo() -> nx.MultiDiGraph:
     """ Función que recupera el quiver de calles de Madrid de OpenStreetMap.
     Args: None
@@ -203,7 +331,13 @@ def carga_grafo() -> nx.MultiDiGraph:
         ServiceNotAvailableError: Si no es posible recuperar el grafo de OpenStreetMap.
     """
     fichero = "madrid.graphml"
-    # Si existe el grafo no lo carga
+    fichero_pkl = "madrid.pkl"
+    # El pickle binario se carga mucho más rápido que parsear el XML del graphml,
+    # así que lo preferimos si ya existe (el graphml sigue siendo la fuente canónica)
+    if os.path.exists(fichero_pkl):
+        with open(fichero_pkl, "rb") as f:
+            return pickle.load(f)
+    # Si existe el grafo no lo descarga
     if os.path.exists(fichero):
         G = ox.load_graphml(fichero)
     else:
@@ -212,6 +346,9 @@ def carga_grafo() -> nx.MultiDiGraph:
         except:
             raise ServiceNotAvailableError("No ha sido posible recuperar el grafo de OpenStreetMap")
         ox.save_graphml(G, fichero)
+    # Guardamos la copia binaria para los siguientes arranques
+    with open(fichero_pkl, "wb") as f:
+        pickle.dump(G, f, protocol=5)
     return G
 
 def procesa_grafo(multidigrafo:nx.MultiDiGraph) -> nx.DiGraph:
@@ -222,79 +359,114 @@ def procesa_grafo(multidigrafo:nx.MultiDiGraph) -> nx.DiGraph:
         nx.DiGraph: Grafo dirigido y sin bucles asociado al multidigrafo dado y limpio.
     Raises: None
     """
+    # Si el graphml de origen no ha cambiado reutilizamos el grafo ya procesado,
+    # evitando repetir la limpieza de todas las aristas en cada arranque
+    fichero_cache = None
+    if os.path.exists("madrid.graphml"):
+        with open("madrid.graphml", "rb") as f:
+            clave = hashlib.sha1(f.read()).hexdigest()[:12]
+        fichero_cache = f"procesado_{clave}.pkl"
+        if os.path.exists(fichero_cache):
+            with open(fichero_cache, "rb") as f:
+                return pickle.load(f)
     # Convierte de multidigrafo a digrafo
     G = ox.convert.to_digraph(multidigrafo)
     bucles = list(nx.selfloop_edges(G))
     G.remove_edges_from(bucles)
-    # Recorremos las aristas
-    for _, _, data in G.edges(data=True):
-        highway = data.get("highway")
-        # Si es una lista hay que arreglarlo
-        if isinstance(highway, list) and highway:
-            vel_ant = float("-inf")
-            tipo = ""
-            # Mira las velocidades máximas de cada uno de los tipos de vía
-            for i in highway:
-                vel = float(MAX_SPEEDS.get(i))
-                # Selecciona la vía con la mayor velicidad máxima
-                if vel > vel_ant:
-                    vel_ant = vel
-                    tipo = i
-            # Cambia el tipo de la vía
-            data["highway"] = tipo
-        
-        name = data.get("name")
-        if isinstance(name, list):
-            # Seleccionamos el primer nombre
-            data["name"] = name[0]
-
-        ms = data.get("maxspeed")
-        # Si está vacía "maxspeed" la cambiamos según el diccionario
-        if ms is None or ms == "" or ms == []:
-            h = data.get("highway")
-            data["maxspeed"] = float(MAX_SPEEDS[h])
-        else:
-            # Hay maxspeed pero es lista
-            if isinstance(ms, list):
-                valores = []
-                # Pasamos valores a float
-                for v in ms:
-                    valores.append(float(v))
-                # Cogemos el máximo
-                data["maxspeed"] = max(valores)
-            else:
-                # Si es un número normal
-                try:
-                    data["maxspeed"] = float(data["maxspeed"])
-                except:
-                    h = data.get("highway")
-                    data["maxspeed"] = float(MAX_SPEEDS.get(h))
+    # Limpiamos los atributos de las aristas de forma vectorizada con pandas
+    # en vez de recorrerlas una a una en Python
+    edf = nx.to_pandas_edgelist(G)
+
+    # highway: si es una lista nos quedamos con el tipo de vía de mayor velocidad máxima
+    es_lista = _mascara_listas(edf["highway"])
+    if es_lista.any():
+        hw = edf.loc[es_lista, "highway"].explode()
+        vel = hw.map(MAX_SPEEDS_F)
+        candidatos = pd.DataFrame({"hw": hw.values, "vel": vel.values}, index=hw.index).reset_index()
+        # Orden estable descendente con NaN al final: entre tipos empatados a
+        # velocidad gana el primero de la lista (como hacía el bucle original)
+        # y un tipo sin velocidad conocida nunca gana a uno mapeado
+        mejores = (candidatos.sort_values("vel", ascending=False, na_position="last", kind="stable")
+                   .drop_duplicates("index", keep="first").set_index("index")["hw"])
+        edf.loc[es_lista, "highway"] = mejores
+
+    # name: si es una lista seleccionamos el primer nombre
+    nombres_corregidos = None
+    if "name" in edf.columns:
+        es_lista = _mascara_listas(edf["name"])
+        if es_lista.any():
+            edf.loc[es_lista, "name"] = edf.loc[es_lista, "name"].str[0]
+            nombres_corregidos = es_lista
+
+    # maxspeed: los escalares se convierten a float de golpe; las listas se explotan
+    # y se coge el máximo; lo vacío o no numérico se rellena según el tipo de vía
+    if "maxspeed" in edf.columns:
+        ms = edf["maxspeed"]
+        es_lista = _mascara_listas(ms)
+        ms_num = pd.to_numeric(ms.where(~es_lista), errors="coerce")
+        if es_lista.any():
+            ms_num.loc[es_lista] = pd.to_numeric(ms.loc[es_lista].explode(), errors="coerce").groupby(level=0).max()
+        edf["maxspeed"] = ms_num
+    else:
+        edf["maxspeed"] = np.nan
+    edf["maxspeed"] = edf["maxspeed"].fillna(edf["highway"].map(MAX_SPEEDS_F))
+
+    # Escribimos los atributos limpios de vuelta en el grafo
+    edf = edf.set_index(["source", "target"])
+    nx.set_edge_attributes(G, edf["highway"].dropna().to_dict(), "highway")
+    nx.set_edge_attributes(G, edf["maxspeed"].dropna().to_dict(), "maxspeed")
+    if nombres_corregidos is not None:
+        nx.set_edge_attributes(G, edf.loc[nombres_corregidos.values, "name"].to_dict(), "name")
+    # Guardamos las coordenadas de los nodos como arrays contiguos (estructura de arrays)
+    # para que los cálculos sobre rutas no tengan que consultar los diccionarios de nodo
+    G.graph["node_idx"] = {n: i for i, n in enumerate(G.nodes)}
+    G.graph["xs"] = np.fromiter((d["x"] for _, d in G.nodes(data=True)), float, count=G.number_of_nodes())
+    G.graph["ys"] = np.fromiter((d["y"] for _, d in G.nodes(data=True)), float, count=G.number_of_nodes())
+    # Árbol KD sobre las coordenadas para resolver el nodo más cercano en O(log N)
+    # sin reconstruir ninguna estructura en cada consulta
+    G.graph["kdtree"] = cKDTree(np.column_stack([G.graph["xs"], G.graph["ys"]]))
+    G.graph["node_list"] = list(G.nodes)
+    # Posiciones de los nodos para dibujar, calculadas una única vez
+    G.graph["pos"] = dict(zip(G.nodes, zip(G.graph["xs"].tolist(), G.graph["ys"].tolist())))
+    # Diccionarios planos (u, v) -> atributo: una sola consulta por arista en vez de
+    # los dos saltos encadenados de G[u][v]
+    G.graph["nombres"] = nx.get_edge_attributes(G, "name")
+    G.graph["longitudes"] = nx.get_edge_attributes(G, "length")
+    # Guardamos el resultado para los siguientes arranques
+    if fichero_cache is not None:
+        with open(fichero_cache, "wb") as f:
+            pickle.dump(G, f, protocol=5)
     return G
 
 def dibujar_grafo_nx(G:nx.DiGraph, min_long=0.0000001):
-    xs, ys, us, vs = [], [], [], []
-
-    for i, (u,v) in enumerate(G.edges):
-        x1, y1 = G.nodes[u]["x"], G.nodes[u]["y"]
-        
-        x2, y2 = G.nodes[v]["x"], G.nodes[v]["y"]
-
-        dx = x2 - x1
-        dy = y2 - y1
-
-        norm = np.hypot(dx, dy)
-        if norm == 0:
-            continue
-
-        if norm < min_long:
-            factor = min_long / norm
-            dx *= factor
-            dy *= factor
-
-        xs.append(x1)
-        ys.append(y1)
-        us.append(dx)
-        vs.append(dy)
+    # Coordenadas de los nodos como arrays (reutilizamos las que prepara procesa_grafo si están)
+    node_idx = G.graph.get("node_idx")
+    if node_idx is not None:
+        xs_n, ys_n = G.graph["xs"], G.graph["ys"]
+    else:
+        node_idx = {n: i for i, n in enumerate(G.nodes)}
+        xs_n = np.fromiter((d["x"] for _, d in G.nodes(data=True)), float, count=G.number_of_nodes())
+        ys_n = np.fromiter((d["y"] for _, d in G.nodes(data=True)), float, count=G.number_of_nodes())
+
+    # Extremos de cada arista como índices sobre los arrays de coordenadas
+    n_aristas = G.number_of_edges()
+    u_arr = np.fromiter((node_idx[u] for u, _ in G.edges), int, count=n_aristas)
+    v_arr = np.fromiter((node_idx[v] for _, v in G.edges), int, count=n_aristas)
+
+    # Cálculo vectorizado de los vectores de las aristas
+    xs, ys = xs_n[u_arr], ys_n[u_arr]
+    us = xs_n[v_arr] - xs
+    vs = ys_n[v_arr] - ys
+    norm = np.hypot(us, vs)
+
+    # Descartamos aristas de longitud cero
+    validas = norm > 0
+    xs, ys, us, vs, norm = xs[validas], ys[validas], us[validas], vs[validas], norm[validas]
+
+    # Alargamos las aristas demasiado cortas hasta min_long para que se vean
+    factor = np.where(norm < min_long, min_long / norm, 1.0)
+    us = us * factor
+    vs = vs * factor
 
     plt.figure(figsize=(10,10))
     plt.quiver(
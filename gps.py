@@ -5,7 +5,11 @@ import pandas as pd
 import networkx as nx
 import osmnx as ox
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import math
+import numpy as np
+import functools
+from concurrent.futures import ThreadPoolExecutor, Future
 
 
 def crear_grafo() -> Tuple[pd.DataFrame, nx.DiGraph]:
@@ -13,42 +17,102 @@ def crear_grafo() -> Tuple[pd.DataFrame, nx.DiGraph]:
     df = callejero.carga_callejero()
     grafo = callejero.carga_grafo()
     grafo_p = callejero.procesa_grafo(grafo)
+    grafo_pesado.precalcula_pesos(grafo_p)
 
     return df, grafo_p
 
+# Referencias a los datos en uso, para poder memoizar la geocodificación por dirección
+_df_actual = None
+_grafo_actual = None
+
+def _actualiza_datos(G: nx.DiGraph, df: pd.DataFrame) -> None:
+    """Registra el grafo y el callejero en uso; si cambian, las cachés por dirección
+    anteriores dejan de valer."""
+    global _df_actual, _grafo_actual
+    if _df_actual is not df or _grafo_actual is not G:
+        _coordenadas_direccion.cache_clear()
+        _geocodifica.cache_clear()
+        _df_actual = df
+        _grafo_actual = G
+
+@functools.lru_cache(maxsize=1024)
+def _coordenadas_direccion(direccion: str) -> Tuple[float, float]:
+    """Resuelve una dirección (ya sin espacios sobrantes) a sus coordenadas (lat, lon).
+    Al estar cacheada, repetir una dirección (correcciones, rutas de vuelta...) se salta
+    la búsqueda fuzzy, que es con diferencia la parte cara."""
+    return callejero.busca_direccion_fuzzy(direccion, _df_actual)
+
+@functools.lru_cache(maxsize=1024)
+def _geocodifica(direccion: str) -> int:
+    """Resuelve una dirección (ya sin espacios sobrantes) al nodo más cercano del grafo."""
+    lat, lon = _coordenadas_direccion(direccion)
+    # Con el árbol KD que prepara procesa_grafo la consulta es O(log N);
+    # si el grafo no lo trae, recurrimos a osmnx
+    arbol = _grafo_actual.graph.get("kdtree")
+    if arbol is not None:
+        _, i = arbol.query([lon, lat])
+        return _grafo_actual.graph["node_list"][i]
+    return ox.nearest_nodes(_grafo_actual, lon, lat)
+
 def encontrar_nodo(direccion:str, G: nx.DiGraph, df:pd.DataFrame)-> int:
-    lat, lon = callejero.busca_direccion_fuzzy(direccion, df)
-    
-    nodo = ox.nearest_nodes(G, lon, lat)
-    return nodo
-
-def _nombre_calle(G: nx.DiGraph, u: int, v: int) -> str:
-    """Devuelve un nombre de calle para la arista (u, v)."""
-    datos = G[u][v]
-    nombre = datos.get("name")
+    _actualiza_datos(G, df)
+    return _geocodifica(direccion.strip())
+
+def encontrar_nodos(direcciones: List[str], G: nx.DiGraph, df: pd.DataFrame) -> List[int]:
+    """Versión por lotes de encontrar_nodo: resuelve varias direcciones con una única
+    consulta al árbol KD, amortizando el cruce Python->C entre todos los puntos.
+    Las coordenadas de cada dirección salen de la misma caché que usa encontrar_nodo,
+    así que las direcciones repetidas no vuelven a pagar la búsqueda fuzzy."""
+    _actualiza_datos(G, df)
+    arbol = G.graph.get("kdtree")
+    if arbol is None:
+        return [_geocodifica(direccion.strip()) for direccion in direcciones]
+    coordenadas = [_coordenadas_direccion(direccion.strip()) for direccion in direcciones]
+    puntos = np.array([[lon, lat] for lat, lon in coordenadas])
+    _, indices = arbol.query(puntos)
+    nodos = G.graph["node_list"]
+    return [nodos[i] for i in indices]
+
+def _formatea_nombre(nombre) -> str:
+    """Devuelve un nombre de calle presentable a partir del atributo 'name' de una arista."""
     if nombre is None or str(nombre).strip() == "":
         return "vía sin nombre"
 
     return str(nombre)
 
-def _calcular_giro(camino: List[int], G: nx.DiGraph, idx_inicio_segmento: int) -> str | None:
-    """Calcula el tipo de giro en el nodo donde empieza un nuevo tramo. Se usa el nodo anterior (n0), el nodo de cruce (n1) y el siguiente (n2)
+def _coordenadas_camino(camino: List[int], G: nx.DiGraph) -> Tuple[List[float], List[float]]:
+    """Devuelve los incrementos (dx, dy) entre nodos consecutivos del camino.
+    Si el grafo trae las coordenadas precalculadas como arrays (las prepara procesa_grafo),
+    las usa directamente en vez de consultar el diccionario de cada nodo.
+    Los incrementos se devuelven como listas de float de Python: el cálculo de cada giro
+    opera sobre seis escalares y los escalares de NumPy solo añadirían sobrecoste.
+    """
+    node_idx = G.graph.get("node_idx")
+    if node_idx is not None:
+        idx = np.array([node_idx[n] for n in camino])
+        xs = G.graph["xs"][idx]
+        ys = G.graph["ys"][idx]
+    else:
+        # Una sola consulta del diccionario de cada nodo para sacar x e y
+        nodos = G.nodes
+        datos = [nodos[n] for n in camino]
+        xs = np.array([d["x"] for d in datos], dtype=float)
+        ys = np.array([d["y"] for d in datos], dtype=float)
+    return np.diff(xs).tolist(), np.diff(ys).tolist()
+
+def _calcular_giro(dx: List[float], dy: List[float], idx_inicio_segmento: int) -> str | None:
+    """Calcula el tipo de giro en el nodo donde empieza un nuevo tramo, a partir de los
+    incrementos (dx, dy) del camino. El vector de llegada al cruce es el tramo anterior
+    y el de salida el siguiente.
     """
-    # Necesitamos tener un nodo anterior y uno siguiente, no puede ser ni el primero ni el último
-    if idx_inicio_segmento <= 0 or idx_inicio_segmento + 1 >= len(camino):
+    # Necesitamos tener un tramo de llegada y uno de salida, no puede ser ni el primero ni el último nodo
+    if idx_inicio_segmento <= 0 or idx_inicio_segmento >= len(dx):
         return None
 
-    n0 = camino[idx_inicio_segmento - 1]
-    n1 = camino[idx_inicio_segmento]
-    n2 = camino[idx_inicio_segmento + 1]
-
-    x0, y0 = G.nodes[n0]["x"], G.nodes[n0]["y"]
-    x1, y1 = G.nodes[n1]["x"], G.nodes[n1]["y"]
-    x2, y2 = G.nodes[n2]["x"], G.nodes[n2]["y"]
     # vector de llegada al cruce
-    v1x, v1y = x1 - x0, y1 - y0
+    v1x, v1y = dx[idx_inicio_segmento - 1], dy[idx_inicio_segmento - 1]
     # vector de salida del cruce
-    v2x, v2y = x2 - x1, y2 - y1
+    v2x, v2y = dx[idx_inicio_segmento], dy[idx_inicio_segmento]
 
     # Comprobamos que no sean vectores nulos
     if v1x == 0 and v1y == 0:
@@ -142,11 +206,19 @@ def construir_instrucciones(camino: List[int], G: nx.DiGraph) -> List[str]:
     # Primero construimos segmentos de la calle
     segmentos = []
 
+    # Diccionarios planos (u, v) -> atributo: los prepara procesa_grafo; si el grafo
+    # no los trae, los construimos aquí una sola vez
+    nombres = G.graph.get("nombres")
+    longitudes = G.graph.get("longitudes")
+    if nombres is None or longitudes is None:
+        nombres = nx.get_edge_attributes(G, "name")
+        longitudes = nx.get_edge_attributes(G, "length")
+
     # Inicializamos con la primera arista
     u0 = camino[0]
     v0 = camino[1]
-    nombre_actual = _nombre_calle(G, u0, v0)
-    dist_actual = float(G[u0][v0].get("length", 0.0))
+    nombre_actual = _formatea_nombre(nombres.get((u0, v0)))
+    dist_actual = float(longitudes.get((u0, v0), 0.0))
     # índice en 'camino' donde empieza este segmento
     inicio_idx = 0
 
@@ -154,9 +226,8 @@ def construir_instrucciones(camino: List[int], G: nx.DiGraph) -> List[str]:
     for i in range(1, len(camino) - 1):
         u = camino[i]
         v = camino[i + 1]
-        datos = G[u][v]
-        nombre = _nombre_calle(G, u, v)
-        longitud = float(datos.get("length", 0.0))
+        nombre = _formatea_nombre(nombres.get((u, v)))
+        longitud = float(longitudes.get((u, v), 0.0))
         if nombre == nombre_actual:
             # Misma calle -> acumulamos distancia
             dist_actual += longitud
@@ -184,6 +255,8 @@ def construir_instrucciones(camino: List[int], G: nx.DiGraph) -> List[str]:
         }
     )
     # Construimos las frases usando los segmentos y calculando giros
+    # Los incrementos entre nodos se calculan una sola vez para todo el camino
+    dx, dy = _coordenadas_camino(camino, G)
     instrucciones: List[str] = []
     total_dist = 0.0
 
@@ -196,7 +269,7 @@ def construir_instrucciones(camino: List[int], G: nx.DiGraph) -> List[str]:
         else:
             # El giro se calcula en el nodo donde empieza este segmento
             idx_inicio = seg["inicio"]
-            giro = _calcular_giro(camino, G, idx_inicio)
+            giro = _calcular_giro(dx, dy, idx_inicio)
         frase = _frase_segmento(nombre=nombre, dist_m=dist, es_primero=(j == 0), giro=giro,)
         instrucciones.append(frase)
         total_dist += dist
@@ -216,18 +289,38 @@ def dibujar_ruta(camino:List[int], grafo:nx.DiGraph) -> None:
     if not camino:
         print("No hay ruta que dibujar (el camino está vacío).")
         return
-    pos = {n:(datos["x"], datos["y"]) for n, datos in grafo.nodes(data=True)}
+    # Posiciones de los nodos: las prepara procesa_grafo; si no están, se calculan aquí
+    pos = grafo.graph.get("pos")
+    if pos is None:
+        pos = {n:(datos["x"], datos["y"]) for n, datos in grafo.nodes(data=True)}
     path_edges = list(zip(camino[:-1], camino[1:]))
     plt.figure(figsize=(10, 10))
 
     # Todas las calles en gris
-    nx.draw_networkx_edges(
-        grafo,
-        pos,
-        edge_color="lightgray",
-        width=0.5,
-        arrows=False,
-    )
+    node_idx = grafo.graph.get("node_idx")
+    if node_idx is not None:
+        # Una única LineCollection a partir de los arrays de coordenadas,
+        # mucho más rápido que iterar las aristas en Python
+        xs_n, ys_n = grafo.graph["xs"], grafo.graph["ys"]
+        n_aristas = grafo.number_of_edges()
+        u_arr = np.fromiter((node_idx[u] for u, _ in grafo.edges), int, count=n_aristas)
+        v_arr = np.fromiter((node_idx[v] for _, v in grafo.edges), int, count=n_aristas)
+        segmentos = np.stack(
+            [np.column_stack([xs_n[u_arr], ys_n[u_arr]]),
+             np.column_stack([xs_n[v_arr], ys_n[v_arr]])],
+            axis=1,
+        )
+        ax = plt.gca()
+        ax.add_collection(LineCollection(segmentos, colors="lightgray", linewidths=0.5))
+        ax.autoscale()
+    else:
+        nx.draw_networkx_edges(
+            grafo,
+            pos,
+            edge_color="lightgray",
+            width=0.5,
+            arrows=False,
+        )
     # Ruta en rojo, un pelín más ancha
     nx.draw_networkx_edges(
         grafo,
@@ -242,14 +335,19 @@ def dibujar_ruta(camino:List[int], grafo:nx.DiGraph) -> None:
     plt.tight_layout()
     plt.show()
 
-def bucle_interactivo(df:pd.DataFrame, grafo: nx.DiGraph):
+def bucle_interactivo(df:pd.DataFrame, grafo: nx.DiGraph | Future):
     origen = input("Introduzca la direccion de la que se quiere partir.")
     destino = input("Introduzca la direccion de destino.")
 
+    # Si el grafo se está cargando en segundo plano, esperamos aquí: el usuario
+    # ya ha tecleado las primeras direcciones mientras tanto
+    if isinstance(grafo, Future):
+        grafo = grafo.result()
+
     while origen and destino:
         opcion = 0
-        nodo_or = encontrar_nodo(origen, grafo, df)
-        nodo_de = encontrar_nodo(destino, grafo, df)
+        # Origen y destino en una sola consulta al árbol KD
+        nodo_or, nodo_de = encontrar_nodos([origen, destino], grafo, df)
 
         opciones = ["1", "2", "3"]
         while opcion not in opciones:
@@ -277,9 +375,20 @@ def bucle_interactivo(df:pd.DataFrame, grafo: nx.DiGraph):
         destino = input("Introduzca la direccion de destino.")
 
 
+def _carga_grafo_completo() -> nx.DiGraph:
+    """Carga, procesa y deja listo para consultar el grafo de calles."""
+    grafo = callejero.procesa_grafo(callejero.carga_grafo())
+    grafo_pesado.precalcula_pesos(grafo)
+    return grafo
+
+
 def main():
-    df, grafo = crear_grafo()
-    bucle_interactivo(df, grafo)
+    # Lanzamos la carga y el procesado del grafo en un hilo aparte para que el
+    # arranque quede solapado con los primeros input() del usuario
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        futuro_grafo = executor.submit(_carga_grafo_completo)
+        df = callejero.carga_callejero()
+        bucle_interactivo(df, futuro_grafo)
 
 
 if __name__ == '__main__':
@@ -15,12 +15,18 @@ Librería para el análisis de grafos pesados.
 
 from typing import List,Tuple,Dict,Callable,Union
 import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
 import sys
 import callejero
+import functools
 import itertools
 import heapq #Librería para la creación de colas de prioridad
 
 INFTY=sys.float_info.max #Distincia "infinita" entre nodos de un grafo
+ESPERA_SEMAFORO_S=0.8*30.0 #Espera media por cruce: probabilidad 0.8 de parar 30 s
 
 """
 En las siguientes funciones, las funciones de peso son funciones que reciben un grafo o digrafo y dos vértices y devuelven un real (su peso)
@@ -36,6 +42,43 @@ camino=dijkstra(G,mi_peso,origen, destino)
 
 """
 
+def precalcula_pesos(G:Union[nx.Graph, nx.DiGraph]) -> None:
+    """Precalcula de golpe el peso de todas las aristas para las tres funciones de peso
+    (mas_corto, mas_rapido y mas_rapido_semaforos) y lo guarda en G.graph.
+    El parseo de 'maxspeed' (y su respaldo por tipo de vía) se hace aquí una sola
+    vez por arista, de forma vectorizada; si estos diccionarios existen, las
+    funciones de peso los consultan directamente, con lo que cada relajación
+    dentro de dijkstra pasa de varios accesos a atributos, conversiones y saltos
+    condicionales a una única lectura de diccionario.
+
+    Args:
+        G (nx.Graph o nx.DiGraph): grafo de calles con atributos 'length', 'maxspeed' y 'highway'
+    Returns: None
+    """
+    aristas = list(G.edges)
+    longitudes = nx.get_edge_attributes(G, "length")
+    maxspeeds = nx.get_edge_attributes(G, "maxspeed")
+    highways = nx.get_edge_attributes(G, "highway")
+
+    # Longitudes y velocidades de todas las aristas como arrays, con el mismo
+    # respaldo por tipo de vía que usa _velocidad_kmh
+    long_arr = pd.to_numeric(pd.Series([longitudes.get(a) for a in aristas]), errors="coerce").fillna(0.0).to_numpy()
+    vel_kmh = pd.to_numeric(pd.Series([maxspeeds.get(a) for a in aristas]), errors="coerce")
+    vel_kmh = vel_kmh.fillna(pd.Series([highways.get(a) for a in aristas]).map(callejero.MAX_SPEEDS_F)).to_numpy()
+    tiempos = long_arr / (vel_kmh / 3.6)
+
+    G.graph["peso_corto"] = dict(zip(aristas, long_arr.tolist()))
+    G.graph["peso_rapido"] = dict(zip(aristas, tiempos.tolist()))
+    # La espera media por cruce va ya sumada: la función de peso no opera nada
+    G.graph["peso_semaforos"] = dict(zip(aristas, (tiempos + ESPERA_SEMAFORO_S).tolist()))
+
+    if not G.is_directed():
+        # En un grafo no dirigido la arista puede consultarse en los dos sentidos
+        for clave in ("peso_corto", "peso_rapido", "peso_semaforos"):
+            cache = G.graph[clave]
+            cache.update({(v, u): w for (u, v), w in list(cache.items())})
+
+
 def mas_corto(G:Union[nx.Graph, nx.DiGraph], u:object, v:object) -> float:
     """Función de peso para calcular la ruta más corta en metros. Devuelve la longitud de la arista (u, v) en metros, usando el atributo 'length'
 
@@ -47,16 +90,20 @@ def mas_corto(G:Union[nx.Graph, nx.DiGraph], u:object, v:object) -> float:
     Returns:
         float: longitud de la arista (u, v) en metros
     """
+    cache = G.graph.get("peso_corto")
+    if cache is not None:
+        return cache[(u, v)]
     return float(G[u][v]["length"])
 
-def _velocidad_kmh(G:nx.Graph, u:object, v:object) -> float:
-    """Devuelve la velocidad máxima (en km/h) para la arista (u, v).
+@functools.lru_cache(maxsize=None)
+def _velocidad_desde_atributos(maxspeed, highway) -> float:
+    """Convierte los atributos crudos 'maxspeed' y 'highway' en una velocidad en km/h.
+    Al estar memoizada, el parseo de cada combinación de valores se paga una sola vez
+    aunque la arista se consulte en muchas relajaciones.
     """
-    datos = G[u][v]
     velocidad_kmh = None
 
     # Intenta usar 'maxspeed' de la arista
-    maxspeed = datos.get("maxspeed")
     if maxspeed is not None:
         texto = str(maxspeed).strip()
         if texto:
@@ -67,11 +114,19 @@ def _velocidad_kmh(G:nx.Graph, u:object, v:object) -> float:
 
     # Si no hay maxspeed usable, usar tipo de vía 'highway'
     if velocidad_kmh is None:
-        highway = datos.get("highway")
-        valor = callejero.MAX_SPEEDS.get(highway)
-        velocidad_kmh = float(valor)
+        velocidad_kmh = callejero.MAX_SPEEDS_F[highway]
     return velocidad_kmh
 
+def _velocidad_kmh(G:nx.Graph, u:object, v:object) -> float:
+    """Devuelve la velocidad máxima (en km/h) para la arista (u, v).
+    """
+    datos = G[u][v]
+    maxspeed = datos.get("maxspeed")
+    # Las listas no son "hashables": las pasamos a tupla para poder memoizar
+    if isinstance(maxspeed, list):
+        maxspeed = tuple(maxspeed)
+    return _velocidad_desde_atributos(maxspeed, datos.get("highway"))
+
 def mas_rapido(G:nx.Graph, u:object, v:object) -> float:
     """Función de peso para calcular la ruta más rápida.
     El peso es el tiempo de viaje estimado en segundos, suponiendo que se circula a la velocidad máxima permitida en esa vía
@@ -85,6 +140,9 @@ def mas_rapido(G:nx.Graph, u:object, v:object) -> float:
     Returns:
         float: tiempo de recorrido de la arista (u, v) en segundos
     """
+    cache = G.graph.get("peso_rapido")
+    if cache is not None:
+        return cache[(u, v)]
     datos = G[u][v]
     longitud = datos.get("length")
     longitud_m = float(longitud)
@@ -108,22 +166,170 @@ def mas_rapido_semaforos(G:nx.Graph, u:object, v:object) -> float:
     Returns:
         float: Tiempo esperado de recorrido de la arista (u, v) en segundos.
     """
-    # Tiempo base de circular a velocidad máxima
-    tiempo_base = mas_rapido(G, u, v)
-    # Probabilidad de tener que parar
-    p = 0.8
-    tiempo_parada = 30.0
-    espera_esperada = p * tiempo_parada
-    return tiempo_base + espera_esperada
+    cache = G.graph.get("peso_semaforos")
+    if cache is not None:
+        return cache[(u, v)]
+    # Tiempo base de circular a velocidad máxima más la espera media del cruce
+    return mas_rapido(G, u, v) + ESPERA_SEMAFORO_S
 
 
-def dijkstra(G:Union[nx.Graph, nx.DiGraph], peso:Union[Callable[[nx.Graph,object,object],float], Callable[[nx.DiGraph,object,object],float]], origen:object)-> Dict[object,object]:
+def invalida_caches(G:Union[nx.Graph, nx.DiGraph]) -> None:
+    """Invalida todas las cachés que esta librería guarda en G.graph (representación
+    CSR, pesos precalculados y árboles de caminos mínimos). Debe llamarse después de
+    modificar los vértices, las aristas o sus atributos.
+
+    Args:
+        G (nx.Graph o nx.DiGraph): grafo cuyas cachés se quieren descartar
+    Returns: None
+    """
+    for clave in ("_csr", "_csr_inv", "_dijkstra_cache", "_vel_maxima", "peso_corto", "peso_rapido", "peso_semaforos"):
+        G.graph.pop(clave, None)
+
+
+def _a_csr(G:Union[nx.Graph, nx.DiGraph], peso:Callable) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[object], Dict[object,int]]:
+    """Convierte el grafo a representación CSR: un array indptr de inicios por nodo,
+    un array indices con los vecinos y un array pesos con el peso de cada arista,
+    con los nodos mapeados a enteros consecutivos. El resultado se cachea en G.graph
+    por función de peso, de modo que la conversión solo se paga una vez.
+
+    Args:
+        G (nx.Graph o nx.DiGraph): grafo
+        peso (función): función de peso de las aristas
+    Returns:
+        Tupla (indptr, indices, pesos, nodos, indice) donde nodos[i] es el nodo con id i
+        e indice es el diccionario inverso nodo -> id.
+    """
+    caches = G.graph.setdefault("_csr", {})
+    entrada = caches.get(peso)
+    if entrada is not None:
+        return entrada
+
+    nodos = list(G.nodes)
+    indice = {v: i for i, v in enumerate(nodos)}
+    total = sum(len(G.adj[v]) for v in nodos)
+
+    indptr = np.zeros(len(nodos) + 1, dtype=np.int64)
+    indices = np.empty(total, dtype=np.int64)
+    pesos = np.empty(total, dtype=np.float64)
+
+    k = 0
+    for i, v in enumerate(nodos):
+        for x in G.neighbors(v):
+            indices[k] = indice[x]
+            pesos[k] = peso(G, v, x)
+            k += 1
+        indptr[i + 1] = k
+
+    entrada = (indptr, indices, pesos, nodos, indice)
+    caches[peso] = entrada
+    return entrada
+
+
+def _dijkstra_csr(indptr:np.ndarray, indices:np.ndarray, pesos:np.ndarray, origen:int, destino:int=-1) -> np.ndarray:
+    """Núcleo de Dijkstra sobre la representación CSR. Trabaja solo con enteros,
+    floats y arrays planos: sin diccionarios, sin objetos nodo y sin llamadas a la
+    función de peso dentro del bucle.
+
+    Args:
+        indptr, indices, pesos: grafo en formato CSR
+        origen (int): id entero del vértice de origen
+        destino (int, opcional): si es >= 0, la búsqueda termina en cuanto este
+            vértice se extrae del montículo (su distancia ya es definitiva)
+    Returns:
+        np.ndarray: array padre donde padre[i] es el id del padre de i en el árbol
+            de caminos mínimos, o -1 si i es el origen o no es alcanzable. Con
+            destino, el árbol solo es completo para los vértices ya extraídos.
+    """
+    n = len(indptr) - 1
+    dist = np.full(n, INFTY)
+    padre = np.full(n, -1, dtype=np.int64)
+
+    # Montículo binario indexado con decrease-key: monticulo guarda ids de nodo
+    # ordenados por dist y posicion[v] es la casilla de v dentro del montículo
+    # (-1 si v no está en él). Así la cola nunca supera tamaño n, no acumula
+    # entradas obsoletas y cada nodo se extrae exactamente una vez, con lo que
+    # sobran el array visitado y el contador de desempate de las tuplas.
+    monticulo = [origen]
+    posicion = np.full(n, -1, dtype=np.int64)
+    posicion[origen] = 0
+    dist[origen] = 0.0
+
+    def _sube(i:int) -> None:
+        v = monticulo[i]
+        d_v = dist[v]
+        while i > 0:
+            p = (i - 1) >> 1
+            u = monticulo[p]
+            if dist[u] <= d_v:
+                break
+            monticulo[i] = u
+            posicion[u] = i
+            i = p
+        monticulo[i] = v
+        posicion[v] = i
+
+    def _baja(i:int) -> None:
+        v = monticulo[i]
+        d_v = dist[v]
+        m = len(monticulo)
+        while True:
+            h = 2 * i + 1
+            if h >= m:
+                break
+            if h + 1 < m and dist[monticulo[h + 1]] < dist[monticulo[h]]:
+                h += 1
+            u = monticulo[h]
+            if d_v <= dist[u]:
+                break
+            monticulo[i] = u
+            posicion[u] = i
+            i = h
+        monticulo[i] = v
+        posicion[v] = i
+
+    while monticulo:
+        v = monticulo[0]
+        posicion[v] = -1
+        ultimo = monticulo.pop()
+        if monticulo:
+            monticulo[0] = ultimo
+            posicion[ultimo] = 0
+            _baja(0)
+
+        # Al extraerse, la distancia de destino ya es definitiva: no hace
+        # falta explorar el resto del grafo
+        if v == destino:
+            break
+
+        dist_v = dist[v]
+        for k in range(indptr[v], indptr[v + 1]):
+            x = indices[k]
+            nueva = dist_v + pesos[k]
+            if nueva < dist[x]:
+                dist[x] = nueva
+                padre[x] = v
+                p_x = posicion[x]
+                if p_x >= 0:
+                    # decrease-key: la entrada ya existe, solo hay que subirla
+                    _sube(p_x)
+                else:
+                    monticulo.append(int(x))
+                    posicion[x] = len(monticulo) - 1
+                    _sube(len(monticulo) - 1)
+
+    return padre
+
+
+def dijkstra(G:Union[nx.Graph, nx.DiGraph], peso:Union[Callable[[nx.Graph,object,object],float], Callable[[nx.DiGraph,object,object],float]], origen:object, destino:object=None)-> Dict[object,object]:
     """ Calcula un Árbol de Caminos Mínimos para el grafo pesado partiendo
     del vértice "origen" usando el algoritmo de Dijkstra. Calcula únicamente
     el árbol de la componente conexa que contiene a "origen".
-    
+
     Args:
         origen (object): vértice del grafo de origen
+        destino (object, opcional): si se indica, la búsqueda se corta en cuanto
+            su distancia es definitiva; el diccionario devuelto basta para
+            reconstruir el camino hasta destino, pero no es el árbol completo
     Returns:
         Dict[object,object]: Devuelve un diccionario que indica, para cada vértice alcanzable
             desde "origen", qué vértice es su padre en el árbol de caminos mínimos.
@@ -134,40 +340,352 @@ def dijkstra(G:Union[nx.Graph, nx.DiGraph], peso:Union[Callable[[nx.Graph,object
         En particular, un camino mínimo desde 1 hasta 3 sería 1->2->3.
     """
     
-    if not isinstance(origen, (int, str, tuple, frozenset)) and not hasattr(origen, "__hash__"):
-        raise TypeError("El vértice origen debe ser hashable.")
+    # hash() es la comprobación real: en Python 3 todo objeto tiene __hash__
+    # (quizá a None), así que hasattr no detectaba los no "hashables"
+    try:
+        hash(origen)
+    except TypeError as e:
+        raise TypeError("El vértice origen debe ser hashable.") from e
+
+    # Árboles ya calculados para este grafo: consultas repetidas desde el mismo
+    # origen (p. ej. varias rutas desde casa) salen gratis. Usar invalida_caches
+    # tras modificar el grafo.
+    cache = G.graph.setdefault("_dijkstra_cache", {})
+    clave = (peso, origen)
+    padre = cache.get(clave)
+    if padre is not None:
+        # El árbol completo ya calculado sirve también para consultas con destino
+        return padre
+
+    # El trabajo pesado se hace sobre la representación CSR con ids enteros
+    indptr, indices, pesos, nodos, indice = _a_csr(G, peso)
+    id_destino = indice[destino] if destino is not None and destino in indice else -1
+    padre_arr = _dijkstra_csr(indptr, indices, pesos, indice[origen], id_destino)
+
+    # Traducimos los ids de vuelta a los nodos originales; con nonzero solo
+    # recorremos los vértices alcanzados, no los n del grafo
+    # (se devuelve la misma referencia en llamadas repetidas: no modificarla)
+    alcanzados = np.nonzero(padre_arr >= 0)[0]
+    padre = {nodos[i]: nodos[padre_arr[i]] for i in alcanzados}
+    if id_destino < 0:
+        # Solo los árboles completos entran en la caché: uno cortado en el
+        # destino no vale para consultas posteriores
+        cache[clave] = padre
+    return padre
+
 
-    padre = {}
-    dist = {}
-    visitado = {}
+def _delta_stepping_csr(indptr:np.ndarray, indices:np.ndarray, pesos:np.ndarray, origen:int, delta:float) -> np.ndarray:
+    """Núcleo de delta-stepping sobre la representación CSR. Agrupa las distancias
+    tentativas en cubetas de anchura delta y relaja de golpe todas las aristas
+    salientes de una cubeta como una operación vectorizada de numpy (gather,
+    suma, minimum.at), en lugar de arista a arista con un montículo.
 
-    for v in G.nodes:
-        padre[v] = None
-        visitado[v] = False
-        dist[v] = INFTY
+    Args:
+        indptr, indices, pesos: grafo en formato CSR
+        origen (int): id entero del vértice de origen
+        delta (float): anchura de las cubetas de distancia
+    Returns:
+        np.ndarray: array padre con el mismo convenio que _dijkstra_csr.
+    """
+    n = len(indptr) - 1
+    dist = np.full(n, INFTY)
+    padre = np.full(n, -1, dtype=np.int64)
+    dist[origen] = 0.0
+
+    # Origen de cada arista k y clasificación ligera/pesada respecto a delta
+    fuentes = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    ligera = pesos <= delta
+
+    def _relaja(frontera:np.ndarray, mascara_tipo:np.ndarray, cubetas:Dict[int,set]) -> None:
+        # Relaja en bloque todas las aristas del tipo pedido que salen de la frontera
+        activo = np.zeros(n, dtype=bool)
+        activo[frontera] = True
+        m = activo[fuentes] & mascara_tipo
+        if not m.any():
+            return
+        objetivos = indices[m]
+        cand = dist[fuentes[m]] + pesos[m]
+        antes = dist[objetivos].copy()
+        np.minimum.at(dist, objetivos, cand)
+        despues = dist[objetivos]
+        # Gana la ocurrencia cuyo candidato coincide con el mínimo final
+        ganador = (despues < antes) & (cand == despues)
+        padre[objetivos[ganador]] = fuentes[m][ganador]
+        for x, d in zip(objetivos[ganador].tolist(), despues[ganador].tolist()):
+            cubetas.setdefault(int(d / delta), set()).add(x)
+
+    cubetas = {0: {origen}}
+    while cubetas:
+        i = min(cubetas)
+        procesados = set()
+        # Las aristas ligeras pueden reinsertar nodos en la cubeta actual
+        while cubetas.get(i):
+            frontera = np.fromiter(cubetas.pop(i), dtype=np.int64)
+            procesados.update(frontera.tolist())
+            _relaja(frontera, ligera, cubetas)
+        cubetas.pop(i, None)
+        # Las pesadas solo apuntan a cubetas posteriores: basta una pasada
+        if procesados:
+            _relaja(np.fromiter(procesados, dtype=np.int64), ~ligera, cubetas)
 
-    dist[origen] = 0
+    return padre
 
-    contador = itertools.count()
-    Q = [(0, next(contador), origen)]
 
-    while Q:
-        dist_v, _, v = heapq.heappop(Q)
+def dijkstra_delta(G:Union[nx.Graph, nx.DiGraph], peso:Union[Callable[[nx.Graph,object,object],float], Callable[[nx.DiGraph,object,object],float]], origen:object, delta:float=None)-> Dict[object,object]:
+    """ Variante de dijkstra basada en delta-stepping: en lugar de extraer los
+    vértices de uno en uno de un montículo, los agrupa en cubetas de distancia
+    de anchura delta y relaja cada cubeta entera como un lote vectorizado.
+    En grafos de calles (muchos vértices, pesos acotados) el grueso del trabajo
+    pasa a numpy. Devuelve el mismo diccionario de padres que dijkstra.
 
-        if not visitado[v]:
-            visitado[v] = True
+    Args:
+        G (nx.Graph o nx.DiGraph): grafo
+        peso (función): función de peso de las aristas
+        origen (object): vértice del grafo de origen
+        delta (float, opcional): anchura de cubeta; por defecto se ajusta a
+            peso máximo / grado medio, que equilibra tamaño y número de cubetas
+    Returns:
+        Dict[object,object]: padre de cada vértice alcanzable desde "origen"
+            en el árbol de caminos mínimos.
+    Raises:
+        TypeError: Si origen no es "hashable".
+    """
+    try:
+        hash(origen)
+    except TypeError as e:
+        raise TypeError("El vértice origen debe ser hashable.") from e
+
+    indptr, indices, pesos, nodos, indice = _a_csr(G, peso)
+    if len(pesos) == 0:
+        return {}
+    if delta is None:
+        grado_medio = max(len(pesos) / max(len(nodos), 1), 1.0)
+        delta = float(pesos.max()) / grado_medio
+    if delta <= 0.0:
+        delta = 1.0
+
+    padre_arr = _delta_stepping_csr(indptr, indices, pesos, indice[origen], delta)
+
+    alcanzados = np.nonzero(padre_arr >= 0)[0]
+    return {nodos[i]: nodos[padre_arr[i]] for i in alcanzados}
+
+
+def _a_csr_inverso(G:Union[nx.Graph, nx.DiGraph], peso:Callable) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Devuelve la representación CSR del grafo traspuesto (aristas invertidas),
+    necesaria para la búsqueda hacia atrás de la variante bidireccional.
+    Para grafos no dirigidos es la misma que la directa. Se cachea en G.graph.
+    """
+    caches = G.graph.setdefault("_csr_inv", {})
+    entrada = caches.get(peso)
+    if entrada is not None:
+        return entrada
+
+    indptr, indices, pesos, _, _ = _a_csr(G, peso)
+    if not G.is_directed():
+        entrada = (indptr, indices, pesos)
+    else:
+        # Trasponemos el CSR con numpy: cada arista (v, x) pasa a ser (x, v)
+        n = len(indptr) - 1
+        origenes = np.repeat(np.arange(n), np.diff(indptr))
+        orden = np.argsort(indices, kind="stable")
+        indptr_inv = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indices, minlength=n), out=indptr_inv[1:])
+        entrada = (indptr_inv, origenes[orden], pesos[orden])
+    caches[peso] = entrada
+    return entrada
+
+
+def _camino_bidireccional(indptr:np.ndarray, indices:np.ndarray, pesos:np.ndarray,
+                          indptr_inv:np.ndarray, indices_inv:np.ndarray, pesos_inv:np.ndarray,
+                          origen:int, destino:int) -> Union[List[int], None]:
+    """Dijkstra bidireccional sobre la representación CSR: alterna expansiones desde
+    el origen (grafo directo) y desde el destino (grafo traspuesto) y se detiene en
+    cuanto la suma de las claves mínimas de ambos frentes alcanza el mejor encuentro,
+    explorando muchos menos nodos que la búsqueda completa desde el origen.
 
-            for x in G.neighbors(v):
-                w_vx = peso(G, v, x)
-                if dist[x] > dist[v] + w_vx:
-                    dist[x] = dist[v] + w_vx
-                    padre[x] = v
-                    heapq.heappush(Q, (dist[x], next(contador), x))
+    Args:
+        indptr, indices, pesos: grafo en formato CSR
+        indptr_inv, indices_inv, pesos_inv: grafo traspuesto en formato CSR
+        origen (int): id entero del vértice de origen
+        destino (int): id entero del vértice de destino
+    Returns:
+        Lista de ids del camino mínimo de origen a destino, o None si no hay camino.
+    """
+    if origen == destino:
+        return [origen]
 
-    if origen in padre:
-        del padre[origen]
+    n = len(indptr) - 1
+    dist_f = np.full(n, INFTY)
+    dist_b = np.full(n, INFTY)
+    padre_f = np.full(n, -1, dtype=np.int64)
+    padre_b = np.full(n, -1, dtype=np.int64)
+
+    dist_f[origen] = 0.0
+    dist_b[destino] = 0.0
+    Q_f = [(0.0, origen)]
+    Q_b = [(0.0, destino)]
+
+    mejor = INFTY
+    encuentro = -1
+
+    while Q_f and Q_b:
+        # Condición de parada: ningún camino que pase por los frentes puede mejorar
+        if Q_f[0][0] + Q_b[0][0] >= mejor:
+            break
+
+        # Expandimos el frente con la clave mínima más pequeña
+        if Q_f[0][0] <= Q_b[0][0]:
+            dist_v, v = heapq.heappop(Q_f)
+            # Entrada obsoleta del montículo: el nodo ya salió con una clave menor
+            if dist_v > dist_f[v]:
+                continue
+            for k in range(indptr[v], indptr[v + 1]):
+                x = indices[k]
+                nueva = dist_v + pesos[k]
+                if nueva < dist_f[x]:
+                    dist_f[x] = nueva
+                    padre_f[x] = v
+                    heapq.heappush(Q_f, (nueva, int(x)))
+                # ¿Mejora el punto de encuentro de los dos frentes?
+                if nueva + dist_b[x] < mejor:
+                    mejor = nueva + dist_b[x]
+                    encuentro = x
+        else:
+            dist_v, v = heapq.heappop(Q_b)
+            if dist_v > dist_b[v]:
+                continue
+            for k in range(indptr_inv[v], indptr_inv[v + 1]):
+                x = indices_inv[k]
+                nueva = dist_v + pesos_inv[k]
+                if nueva < dist_b[x]:
+                    dist_b[x] = nueva
+                    padre_b[x] = v
+                    heapq.heappush(Q_b, (nueva, int(x)))
+                if nueva + dist_f[x] < mejor:
+                    mejor = nueva + dist_f[x]
+                    encuentro = x
+
+    if encuentro < 0:
+        return None
+
+    # Reconstruimos: tramo origen -> encuentro con los padres hacia delante
+    camino = []
+    v = encuentro
+    while v >= 0:
+        camino.append(v)
+        v = padre_f[v]
+    camino.reverse()
+    # y tramo encuentro -> destino con los padres hacia atrás
+    v = padre_b[encuentro]
+    while v >= 0:
+        camino.append(v)
+        v = padre_b[v]
+    return camino
 
-    return padre
+
+RADIO_TIERRA_M = 6371000.0 #Radio medio de la Tierra en metros, para la distancia haversine
+
+
+def _velocidad_maxima_red(G:Union[nx.Graph, nx.DiGraph]) -> Union[float, None]:
+    """Velocidad máxima (en km/h) presente en las aristas del grafo. Es la cota
+    que hace admisible la heurística de tiempos de A*: el máximo de la tabla de
+    respaldo MAX_SPEEDS_F no sirve, porque una arista con 'maxspeed' propio
+    puede superarlo (autovías a 120 km/h). Recorre las aristas una vez y se
+    cachea en G.graph; devuelve None si alguna velocidad no puede determinarse.
+    """
+    if "_vel_maxima" in G.graph:
+        return G.graph["_vel_maxima"]
+    try:
+        vel = max((_velocidad_kmh(G, u, v) for u, v in G.edges), default=None)
+    except (KeyError, TypeError, ValueError):
+        vel = None
+    G.graph["_vel_maxima"] = vel
+    return vel
+
+
+def _heuristica_objetivo(G:Union[nx.Graph, nx.DiGraph], nodos:List[object], destino:int, peso:Callable) -> Union[np.ndarray, None]:
+    """Construye la heurística admisible de A* hacia el nodo destino: distancia
+    haversine en metros para mas_corto, y esa distancia recorrida a la velocidad
+    máxima de la red (en segundos) para mas_rapido.
+
+    Args:
+        G (nx.Graph o nx.DiGraph): grafo cuyos nodos llevan coordenadas 'x' (longitud) e 'y' (latitud)
+        nodos (List): lista de nodos en el orden de los ids enteros del CSR
+        destino (int): id entero del vértice de destino
+        peso (función): mas_corto o mas_rapido
+    Returns:
+        np.ndarray con la heurística por nodo, o None si el grafo no tiene coordenadas.
+    """
+    try:
+        datos = G.nodes
+        xs = np.array([datos[n]["x"] for n in nodos], dtype=float)
+        ys = np.array([datos[n]["y"] for n in nodos], dtype=float)
+    except KeyError:
+        return None
+
+    # Distancia haversine vectorizada de todos los nodos al destino
+    lat = np.radians(ys)
+    lon = np.radians(xs)
+    lat_d = lat[destino]
+    lon_d = lon[destino]
+    a = np.sin((lat_d - lat) / 2)**2 + np.cos(lat) * np.cos(lat_d) * np.sin((lon_d - lon) / 2)**2
+    distancias = 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(a))
+
+    if peso is mas_corto:
+        return distancias
+    # Para tiempos: ninguna arista se recorre por encima de la velocidad máxima
+    # real de la red (la de sus aristas, no la de la tabla de respaldo)
+    vel_maxima = _velocidad_maxima_red(G)
+    if vel_maxima is None or vel_maxima <= 0:
+        # Sin cota fiable no hay heurística admisible: que decida el llamador
+        return None
+    return distancias / (vel_maxima / 3.6)
+
+
+def _astar_csr(indptr:np.ndarray, indices:np.ndarray, pesos:np.ndarray, origen:int, destino:int, heuristica:np.ndarray) -> Union[List[int], None]:
+    """A* sobre la representación CSR. Igual que el núcleo de Dijkstra pero ordenando
+    el montículo por coste acumulado más la heurística hacia el destino, con lo que la
+    búsqueda se dirige hacia él y expande muchos menos nodos.
+
+    Args:
+        indptr, indices, pesos: grafo en formato CSR
+        origen (int): id entero del vértice de origen
+        destino (int): id entero del vértice de destino
+        heuristica (np.ndarray): cota inferior por nodo del coste restante hasta el destino
+    Returns:
+        Lista de ids del camino mínimo de origen a destino, o None si no hay camino.
+    """
+    n = len(indptr) - 1
+    dist = np.full(n, INFTY)
+    padre = np.full(n, -1, dtype=np.int64)
+
+    dist[origen] = 0.0
+    Q = [(float(heuristica[origen]), 0.0, origen)]
+
+    while Q:
+        _, dist_v, v = heapq.heappop(Q)
+
+        if v == destino:
+            camino = []
+            while v >= 0:
+                camino.append(v)
+                v = padre[v]
+            camino.reverse()
+            return camino
+
+        # Entrada obsoleta del montículo: el nodo ya salió con una clave menor
+        if dist_v > dist[v]:
+            continue
+
+        for k in range(indptr[v], indptr[v + 1]):
+            x = indices[k]
+            nueva = dist_v + pesos[k]
+            if nueva < dist[x]:
+                dist[x] = nueva
+                padre[x] = v
+                heapq.heappush(Q, (nueva + heuristica[x], nueva, int(x)))
+
+    return None
 
 
 def camino_minimo(G:Union[nx.Graph, nx.DiGraph], peso:Union[Callable[[nx.Graph,object,object],float], Callable[[nx.DiGraph,object,object],float]] ,origen:object,destino:object)->List[object]:
@@ -189,29 +707,103 @@ def camino_minimo(G:Union[nx.Graph, nx.DiGraph], peso:Union[Callable[[nx.Graph,o
         TypeError: Si origen o destino no son "hashable".
     """
 
-    if not isinstance(origen, (int, str, tuple, frozenset)) and not hasattr(origen, "__hash__"):
-        raise TypeError("El vértice origen debe ser hashable.")
-    
-    if not isinstance(destino, (int, str, tuple, frozenset)) and not hasattr(destino, "__hash__"):
-        raise TypeError("El vértice destino debe ser hashable.")
-    
+    try:
+        hash(origen)
+    except TypeError as e:
+        raise TypeError("El vértice origen debe ser hashable.") from e
+
+    try:
+        hash(destino)
+    except TypeError as e:
+        raise TypeError("El vértice destino debe ser hashable.") from e
+
     if origen == destino:
         return [origen]
-    camino = [destino]
-    padres = dijkstra(G, peso, origen)
 
-    if destino not in padres:
+    indptr, indices, pesos, nodos, indice = _a_csr(G, peso)
+
+    # Un vértice que no está en el grafo no tiene camino: se devuelve [] igual
+    # que para un destino inalcanzable, en vez de fallar al mapearlo a su id
+    if origen not in indice or destino not in indice:
         return []
 
+    # Para las funciones de peso con heurística admisible conocida usamos A*,
+    # que dirige la búsqueda hacia el destino
+    if peso is mas_corto or peso is mas_rapido:
+        heuristica = _heuristica_objetivo(G, nodos, indice[destino], peso)
+        if heuristica is not None:
+            ids = _astar_csr(indptr, indices, pesos, indice[origen], indice[destino], heuristica)
+            if ids is None:
+                return []
+            return [nodos[i] for i in ids]
+
+    # Búsqueda bidireccional: explora desde los dos extremos a la vez en vez de
+    # calcular el árbol de caminos mínimos completo desde el origen
+    indptr_inv, indices_inv, pesos_inv = _a_csr_inverso(G, peso)
+    ids = _camino_bidireccional(indptr, indices, pesos, indptr_inv, indices_inv, pesos_inv,
+                                indice[origen], indice[destino])
+    if ids is None:
+        return []
 
-    actual = destino
-    while actual != origen:
-        actual = padres[actual]
-        camino.append(actual)
+    return [nodos[i] for i in ids]
 
-    camino.reverse()
 
-    return camino
+def multi_source(G:Union[nx.Graph, nx.DiGraph], peso:Callable, fuentes:List[object]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Calcula caminos mínimos desde varios orígenes a la vez delegando en
+    scipy.sparse.csgraph.dijkstra, que recorre las fuentes en un bucle en C.
+    Para consultas desde muchos orígenes (mapas de isocronas, búsqueda del nodo
+    más céntrico) es mucho más rápido que llamar a dijkstra una vez por fuente.
+
+    Args:
+        G (nx.Graph o nx.DiGraph): grafo
+        peso (función): función de peso de las aristas
+        fuentes (List[object]): vértices de origen
+    Returns:
+        Tupla (dist, pred) de arrays de forma (len(fuentes), n): dist[i][j] es la
+        distancia de fuentes[i] al nodo con id j y pred[i][j] el id de su padre
+        en ese árbol (-9999 si no hay camino). Los ids de columna siguen el orden
+        de list(G.nodes); el mapeo nodo <-> id es el que construye _a_csr.
+    """
+    indptr, indices, pesos, nodos, indice = _a_csr(G, peso)
+    matriz = sparse.csr_matrix((pesos, indices, indptr), shape=(len(nodos), len(nodos)))
+    # _a_csr ya materializa las aristas en ambos sentidos para grafos no
+    # dirigidos, así que la matriz se trata siempre como dirigida
+    return csgraph.dijkstra(matriz, directed=True,
+                            indices=[indice[f] for f in fuentes],
+                            return_predecessors=True)
+
+
+def camino_minimo_bulk(G:Union[nx.Graph, nx.DiGraph], peso:Callable, origen:object, destinos:List[object]) -> List[List[object]]:
+    """ Calcula de una vez los caminos mínimos desde origen hasta cada vértice
+    de destinos, con una única pasada de Dijkstra en C vía multi_source.
+
+    Args:
+        G (nx.Graph o nx.DiGraph): grafo
+        peso (función): función de peso de las aristas
+        origen (object): vértice del grafo de origen
+        destinos (List[object]): vértices de destino
+    Returns:
+        List[List[object]]: una lista de caminos en el mismo formato que
+            camino_minimo, en el orden de destinos ([] si no hay camino).
+    """
+    _, pred = multi_source(G, peso, [origen])
+    pred = pred[0]
+    _, _, _, nodos, indice = _a_csr(G, peso)
+
+    caminos = []
+    for destino in destinos:
+        if destino == origen:
+            caminos.append([origen])
+            continue
+        j = indice[destino]
+        if pred[j] < 0:
+            caminos.append([])
+            continue
+        ids = [j]
+        while ids[-1] != indice[origen]:
+            ids.append(int(pred[ids[-1]]))
+        caminos.append([nodos[i] for i in reversed(ids)])
+    return caminos
 
 
 def prim(G:nx.Graph, peso:Callable[[nx.Graph,object,object],float])-> Dict[object,object]:
@@ -231,18 +823,30 @@ def prim(G:nx.Graph, peso:Callable[[nx.Graph,object,object],float])-> Dict[objec
             1 es padre de 2 y de 4
             2 es padre de 3
     """
-    contador = itertools.count()
+    nodos = list(G.nodes)
+    contador = itertools.count(len(nodos))
+
+    # Peso de cada arista calculado una sola vez y en ambos sentidos: dentro del
+    # bucle una misma arista puede consultarse varias veces
+    pesos_aristas = {}
+    for u, v in G.edges:
+        w = peso(G, u, v)
+        pesos_aristas[(u, v)] = w
+        pesos_aristas[(v, u)] = w
 
-    padre = {}
-    coste = {}
-    Q = []
+    # Listas de vecinos materializadas una vez: iterar una lista es más barato
+    # que volver a entrar en la maquinaria de networkx en cada extracción
+    ady = {v: list(G._adj[v]) for v in nodos}
 
-    for v in G.nodes:
-        padre[v] = None
-        coste[v] = INFTY
-        heapq.heappush(Q, (coste[v], next(contador), v))
+    # dict.fromkeys construye los diccionarios de golpe, sin redimensionados
+    padre = dict.fromkeys(nodos)
+    coste = dict.fromkeys(nodos, INFTY)
 
-    en_Q = set(G.nodes)
+    # Un único heapify O(n) en vez de n inserciones O(log n)
+    Q = [(INFTY, i, v) for i, v in enumerate(nodos)]
+    heapq.heapify(Q)
+
+    en_Q = set(nodos)
 
     while Q:
         coste_v, _, v = heapq.heappop(Q)
@@ -252,9 +856,9 @@ def prim(G:nx.Graph, peso:Callable[[nx.Graph,object,object],float])-> Dict[objec
 
         en_Q.remove(v)
 
-        for x in G.neighbors(v):
+        for x in ady[v]:
             if x in en_Q:
-                w_vx = peso(G, v, x)
+                w_vx = pesos_aristas[(v, x)]
                 if w_vx < coste[x]:
                     coste[x] = w_vx
                     padre[x] = v
@@ -279,27 +883,45 @@ def kruskal(G:nx.Graph, peso:Callable[[nx.Graph,object,object],float])-> List[Tu
         En el ejemplo anterior en que prim(G,peso)={1:None, 2:1, 3:2, 4:1} podríamos tener, por ejemplo,
         kruskal(G,peso)=[(1,2),(1,4),(3,2)]
     """
-    lista = []
-    for u, v in G.edges:
-        lista.append((peso(G,u,v),u,v))
-    
-    lista.sort(key=lambda x:x[0])
-
-    C = {v: {v} for v in G.nodes}
+    # Una única pasada sobre las aristas para evaluar la función de peso; el
+    # orden se calcula con np.argsort sobre un array de float64 contiguo, que
+    # evita las comparaciones de tuplas de Python de ordenar (peso, u, v)
+    aristas = list(G.edges)
+    w_arr = np.fromiter((peso(G, u, v) for u, v in aristas), dtype=np.float64, count=len(aristas))
+    orden = np.argsort(w_arr, kind="stable")
+
+    # Estructura union-find: cada vértice apunta a su representante de componente.
+    # Unir dos componentes es reapuntar una raíz, sin copiar ni recolgar los
+    # conjuntos de miembros como hacía la versión con diccionario de conjuntos
+    padre = {v: v for v in G.nodes}
+    rango = {v: 0 for v in G.nodes}
+
+    def find(x):
+        # Compresión de camino: al subir, colgamos cada vértice de su abuelo
+        while padre[x] != x:
+            padre[x] = padre[padre[x]]
+            x = padre[x]
+        return x
 
     aristas_aam = []
 
-    while lista:
-        c, u, v = lista.pop(0)
-
-        if C[u] != C[v]:
+    # Recorremos las aristas por peso creciente según el orden ya calculado:
+    # pop(0) desplazaba todos los elementos restantes en cada extracción
+    for i in orden:
+        u, v = aristas[i]
+        ru = find(u)
+        rv = find(v)
+        # Si están en componentes distintas la arista entra en el árbol
+        if ru != rv:
             aristas_aam.append((u,v))
 
-            comp_u = C[u]
-            comp_v = C[v]
-            nueva_comp = comp_u.union(comp_v)
-
-            for w in nueva_comp:
-                C[w] = nueva_comp
+            # Unión por rango: el árbol de menor rango cuelga del otro
+            if rango[ru] < rango[rv]:
+                padre[ru] = rv
+            elif rango[ru] > rango[rv]:
+                padre[rv] = ru
+            else:
+                padre[rv] = ru
+                rango[ru] += 1
 
     return aristas_aam
\ No newline at end of file